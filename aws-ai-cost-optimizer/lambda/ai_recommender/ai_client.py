@@ -5,9 +5,97 @@ Supports multiple AI providers: Groq (FREE), OpenRouter, Ollama
 
 import os
 import json
+import time
+import itertools
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any, Optional
 
+# tiktoken gives exact counts for the token-budget check, but loading
+# the cl100k_base encoding can fetch its BPE file over the network, so
+# initialize lazily and tolerate any failure - token counting must never
+# take down the Lambda
+_encoder = None
+_encoder_failed = False
+
+
+def _get_encoder():
+    """Get the tiktoken encoder, or None if it can't be loaded"""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, using heuristic token counts: {str(e)}")
+            _encoder_failed = True
+    return _encoder
+
+# orjson parses the per-chunk stream payloads several times faster than
+# stdlib json; fall back where the wheel isn't installed
+try:
+    import orjson
+
+    def _json_loads(data):
+        return orjson.loads(data)
+except ImportError:
+    def _json_loads(data):
+        return json.loads(data)
+
+# Shared session so warm Lambda containers reuse the TLS connection
+# instead of paying a new handshake on every invocation
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+_SESSION.mount('https://', _ADAPTER)
+_SESSION.mount('http://', _ADAPTER)
+
+# Static instructions sent as the system message on every call.
+# Keeping this byte-identical across runs lets OpenAI-compatible providers
+# reuse their prompt-prefix cache; Anthropic models (via OpenRouter) cache
+# it explicitly with cache_control
+_STATIC_PREFIX = """You are an AWS cost optimization expert. Analyze the infrastructure data you are given and create a clear, actionable cost optimization report.
+
+Create a professional cost optimization report with:
+1. Executive Summary (2-3 sentences)
+2. Top 3 Priority Actions (with specific resource IDs and savings)
+3. Quick Wins (easy to implement)
+4. Long-term Optimizations
+
+Use clear formatting with emojis for readability. Be specific and actionable.
+Keep the tone professional but friendly."""
+
+# How many recommendations to include in the prompt before summarizing
+# the remainder as a single count/sum line
+_MAX_PROMPT_RECS = 20
+
+# Retry budget for transient provider failures
+_MAX_ATTEMPTS = 3
+_CONNECT_TIMEOUT = 3
+
+# Context windows for the default models; unknown models get a
+# conservative budget so we trim rather than get rejected
+_MODEL_CONTEXT_WINDOWS = {
+    'llama-3.1-70b-versatile': 131072,
+    'anthropic/claude-3.5-sonnet': 200000,
+    'llama3.1': 131072,
+}
+_DEFAULT_CONTEXT_WINDOW = 8192
+
+# Slack left for message framing and provider overhead
+_TOKEN_HEADROOM = 256
+
+# Returned without calling any provider when there is nothing to optimize
+_NO_RECOMMENDATIONS_REPORT = """✅ No cost optimization opportunities found at this time.
+Your infrastructure appears well-optimized! The next scheduled analysis
+will check again for new savings opportunities."""
+
+
+class AIProviderError(Exception):
+    """
+    Raised when a provider call fails after retries
+    Callers decide how to degrade (e.g. the handler's fallback report)
+    """
+
 
 class AIClient:
     """
@@ -16,21 +104,46 @@ class AIClient:
     
     def __init__(self):
         self.provider = os.environ.get('AI_PROVIDER', 'groq').lower()
-        self.api_key = self._get_api_key()
+        self._api_keys = self._get_api_keys()
+        self.api_key = self._api_keys[0] if self._api_keys else None
+        self._key_iter = itertools.cycle(self._api_keys) if self._api_keys else None
         self.model = os.environ.get('AI_MODEL', self._get_default_model())
         self.temperature = float(os.environ.get('AI_TEMPERATURE', '0.7'))
         self.max_tokens = int(os.environ.get('AI_MAX_TOKENS', '2000'))
-        
-    def _get_api_key(self) -> Optional[str]:
-        """Get API key based on provider"""
+        self.read_timeout = float(os.environ.get('AI_READ_TIMEOUT', '20'))
+
+        # Ollama can run behind several hosts; rotate across them too
+        # `or` so an empty OLLAMA_HOSTS doesn't mask the singular var
+        hosts = (os.environ.get('OLLAMA_HOSTS')
+                 or os.environ.get('OLLAMA_HOST', 'http://localhost:11434'))
+        self._ollama_hosts = itertools.cycle(
+            [h.strip() for h in hosts.split(',') if h.strip()]
+        )
+
+    def _get_api_keys(self) -> List[str]:
+        """
+        Get API key(s) based on provider
+        A comma-separated list (GROQ_API_KEYS / OPENROUTER_API_KEYS) is
+        rotated round-robin per call, multiplying effective rate limits
+        """
         if self.provider == 'groq':
-            return os.environ.get('GROQ_API_KEY')
+            # `or` so a plural var set to "" doesn't mask the singular one
+            raw = os.environ.get('GROQ_API_KEYS') or os.environ.get('GROQ_API_KEY', '')
         elif self.provider == 'openrouter':
-            return os.environ.get('OPENROUTER_API_KEY')
+            raw = (os.environ.get('OPENROUTER_API_KEYS')
+                   or os.environ.get('OPENROUTER_API_KEY', ''))
         elif self.provider == 'ollama':
-            return None  # Ollama doesn't need API key
+            return []  # Ollama doesn't need API keys
         else:
             raise ValueError(f"Unsupported AI provider: {self.provider}")
+
+        return [k.strip() for k in raw.split(',') if k.strip()]
+
+    def _next_api_key(self) -> Optional[str]:
+        """Next key in the round-robin rotation"""
+        if self._key_iter is None:
+            return None
+        return next(self._key_iter)
     
     def _get_default_model(self) -> str:
         """Get default model based on provider"""
@@ -44,11 +157,16 @@ class AIClient:
     def generate_report(self, metrics_data: Dict[str, Any]) -> str:
         """
         Generate cost optimization report using AI
+        Raises AIProviderError if the provider is unavailable
         """
+        # No findings means no provider call - the answer is already known
+        if not metrics_data.get('recommendations'):
+            return _NO_RECOMMENDATIONS_REPORT
+
         print(f"Generating report using {self.provider} with model {self.model}")
-        
-        # Build the prompt
-        prompt = self._build_prompt(metrics_data)
+
+        # Build the prompt, trimmed to the model's token budget
+        prompt = self._fit_prompt(metrics_data)
         
         # Call appropriate provider
         if self.provider == 'groq':
@@ -60,38 +178,136 @@ class AIClient:
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
     
-    def _build_prompt(self, metrics_data: Dict[str, Any]) -> str:
+    def _count_tokens(self, text: str) -> int:
+        """Count prompt tokens (~4 chars/token when tiktoken is unavailable)"""
+        encoder = _get_encoder()
+        if encoder is not None:
+            return len(encoder.encode(text))
+        return len(text) // 4
+
+    def _fit_prompt(self, metrics_data: Dict[str, Any]) -> str:
         """
-        Build the prompt for AI based on collected metrics
+        Build the prompt, dropping lowest-savings recommendations until
+        input + max_tokens fits the model's context window - providers
+        reject or silently truncate over-long requests
+        """
+        context_window = _MODEL_CONTEXT_WINDOWS.get(self.model, _DEFAULT_CONTEXT_WINDOW)
+        budget = (context_window - self.max_tokens - _TOKEN_HEADROOM
+                  - self._count_tokens(_STATIC_PREFIX))
+
+        limit = _MAX_PROMPT_RECS
+        prompt = self._build_prompt(metrics_data, limit)
+
+        while self._count_tokens(prompt) > budget and limit > 1:
+            limit -= 1
+            prompt = self._build_prompt(metrics_data, limit)
+
+        if limit < _MAX_PROMPT_RECS:
+            print(f"Trimmed prompt to {limit} recommendations to fit "
+                  f"{context_window}-token context")
+
+        return prompt
+
+    def _build_prompt(self, metrics_data: Dict[str, Any],
+                      limit: int = _MAX_PROMPT_RECS) -> str:
+        """
+        Build the dynamic (per-run) part of the prompt from collected metrics
+        The static instructions live in _STATIC_PREFIX and are sent as the
+        system message so providers can cache them
         """
         recommendations = metrics_data.get('recommendations', [])
         total_savings = metrics_data.get('total_potential_savings', 0)
-        
+
         # Count resource types
         ec2_count = len(metrics_data.get('metrics', {}).get('ec2_instances', []))
         ebs_count = len(metrics_data.get('metrics', {}).get('ebs_volumes', []))
-        
-        prompt = f"""You are an AWS cost optimization expert. Analyze this infrastructure data and create a clear, actionable cost optimization report.
 
-INFRASTRUCTURE SUMMARY:
+        # Only the highest-savings recommendations go to the model - the
+        # report asks for top actions anyway, and prompt length is cost
+        recs = sorted(recommendations,
+                      key=lambda r: r.get('estimated_savings', 0), reverse=True)
+        top, rest = recs[:limit], recs[limit:]
+
+        # One compact line per recommendation - indented JSON wastes
+        # input tokens on whitespace the model doesn't need
+        rec_lines = "\n".join(
+            f"- {r.get('type', 'unknown')} | {r.get('resource_id', 'N/A')} | "
+            f"${r.get('estimated_savings', 0):.0f}/month | {r.get('message', '')}"
+            for r in top
+        )
+
+        if rest:
+            rest_savings = sum(r.get('estimated_savings', 0) for r in rest)
+            rec_lines += f"\n...and {len(rest)} more totaling ${rest_savings:.2f}/month"
+
+        prompt = f"""INFRASTRUCTURE SUMMARY:
 - EC2 Instances: {ec2_count}
 - EBS Volumes: {ebs_count}
 - Total Potential Savings: ${total_savings:.2f}/month
 
-RECOMMENDATIONS FOUND:
-{json.dumps(recommendations, indent=2)}
+RECOMMENDATIONS FOUND (type | resource | savings | detail):
+{rec_lines}"""
 
-Create a professional cost optimization report with:
-1. Executive Summary (2-3 sentences)
-2. Top 3 Priority Actions (with specific resource IDs and savings)
-3. Quick Wins (easy to implement)
-4. Long-term Optimizations
+        return prompt
 
-Use clear formatting with emojis for readability. Be specific and actionable.
-Keep the tone professional but friendly."""
+    def _system_content(self):
+        """
+        System message content for OpenRouter
+        Anthropic models support explicit prompt caching of the static
+        prefix; other models get the plain string (auto prefix caching)
+        """
+        if self.model.startswith('anthropic/'):
+            return [
+                {
+                    "type": "text",
+                    "text": _STATIC_PREFIX,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ]
+        return _STATIC_PREFIX
+
+    def _post_with_retries(self, url: str, **kwargs) -> requests.Response:
+        """
+        POST with a tuned (connect, read) timeout and bounded backoff
+        Connection errors, timeouts, 429s and 5xx are retried up to
+        _MAX_ATTEMPTS times; other client errors fail immediately
+        """
+        kwargs.setdefault('timeout', (_CONNECT_TIMEOUT, self.read_timeout))
+        last_error = None
+
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                response = _SESSION.post(url, **kwargs)
+                response.raise_for_status()
+                return response
+
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                status = getattr(e.response, 'status_code', None)
+
+                # 4xx other than rate limiting won't get better on retry
+                if status is not None and status != 429 and status < 500:
+                    raise
+
+                last_error = e
+
+                if attempt < _MAX_ATTEMPTS - 1:
+                    wait = 0.5 * 2 ** attempt
+                    if status == 429:
+                        retry_after = e.response.headers.get('Retry-After')
+                        if retry_after:
+                            try:
+                                wait = float(retry_after)
+                            except ValueError:
+                                # Retry-After can also be an HTTP-date;
+                                # keep the exponential delay in that case
+                                pass
+                    print(f"Provider request failed ({str(e)}), retrying in {wait:.1f}s")
+                    time.sleep(wait)
+
+        raise last_error
 
-        return prompt
-    
     def _call_groq(self, prompt: str) -> str:
         """
         Call Groq API (FREE - 6K requests/day)
@@ -99,7 +315,7 @@ Keep the tone professional but friendly."""
         url = "https://api.groq.com/openai/v1/chat/completions"
         
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {self._next_api_key()}",
             "Content-Type": "application/json"
         }
         
@@ -108,7 +324,7 @@ Keep the tone professional but friendly."""
             "messages": [
                 {
                     "role": "system",
-                    "content": "You are an AWS cost optimization expert."
+                    "content": _STATIC_PREFIX
                 },
                 {
                     "role": "user",
@@ -116,19 +332,19 @@ Keep the tone professional but friendly."""
                 }
             ],
             "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "max_tokens": self.max_tokens,
+            "stream": True
         }
-        
+
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result['choices'][0]['message']['content']
-            
-        except requests.exceptions.RequestException as e:
+            response = self._post_with_retries(url, headers=headers,
+                                               json=payload, stream=True)
+
+            return self._read_sse_stream(response)
+
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"Error calling Groq API: {str(e)}")
-            return self._fallback_report(prompt)
+            raise AIProviderError(f"Groq API call failed: {str(e)}") from e
     
     def _call_openrouter(self, prompt: str) -> str:
         """
@@ -137,7 +353,7 @@ Keep the tone professional but friendly."""
         url = "https://openrouter.ai/api/v1/chat/completions"
         
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {self._next_api_key()}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://github.com/yourusername/aws-ai-cost-optimizer",
             "X-Title": "AWS Cost Optimizer"
@@ -148,7 +364,7 @@ Keep the tone professional but friendly."""
             "messages": [
                 {
                     "role": "system",
-                    "content": "You are an AWS cost optimization expert."
+                    "content": self._system_content()
                 },
                 {
                     "role": "user",
@@ -156,67 +372,88 @@ Keep the tone professional but friendly."""
                 }
             ],
             "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "max_tokens": self.max_tokens,
+            "stream": True
         }
-        
+
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result['choices'][0]['message']['content']
-            
-        except requests.exceptions.RequestException as e:
+            response = self._post_with_retries(url, headers=headers,
+                                               json=payload, stream=True)
+
+            return self._read_sse_stream(response)
+
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"Error calling OpenRouter API: {str(e)}")
-            return self._fallback_report(prompt)
+            raise AIProviderError(f"OpenRouter API call failed: {str(e)}") from e
     
     def _call_ollama(self, prompt: str) -> str:
         """
         Call Ollama API (100% FREE - self-hosted)
         """
-        ollama_host = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+        ollama_host = next(self._ollama_hosts)
         url = f"{ollama_host}/api/generate"
         
         payload = {
             "model": self.model,
-            "prompt": prompt,
-            "stream": False
+            "prompt": f"{_STATIC_PREFIX}\n\n{prompt}",
+            "stream": True
         }
-        
+
         try:
-            response = requests.post(url, json=payload, timeout=60)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result['response']
-            
-        except requests.exceptions.RequestException as e:
+            response = self._post_with_retries(url, json=payload, stream=True)
+
+            return self._read_ndjson_stream(response)
+
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"Error calling Ollama API: {str(e)}")
-            return self._fallback_report(prompt)
-    
-    def _fallback_report(self, prompt: str) -> str:
+            raise AIProviderError(f"Ollama API call failed: {str(e)}") from e
+
+    def _read_sse_stream(self, response: requests.Response) -> str:
         """
-        Generate a basic report if AI API fails
+        Accumulate an OpenAI-style Server-Sent Events stream into one string
+        The read timeout applies per chunk instead of the whole generation
         """
-        return """
-🤖 AWS COST OPTIMIZATION REPORT (Fallback Mode)
-
-⚠️ AI service temporarily unavailable. Basic analysis provided:
+        parts = []
+        for line in response.iter_lines():
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if not line.startswith('data: '):
+                continue
+            data = line[len('data: '):]
+            if data == '[DONE]':
+                break
+            chunk = _json_loads(data)
 
-📊 ANALYSIS COMPLETED
-Your infrastructure has been analyzed. Check the DynamoDB table for detailed metrics.
+            # OpenRouter can emit mid-stream error events - surface them
+            # so callers fall back instead of returning a partial report
+            if chunk.get('error'):
+                raise ValueError(f"Provider stream error: {chunk['error']}")
 
-💡 RECOMMENDATIONS
-Review the recommendations stored in the database for cost savings opportunities.
+            # Some chunks (e.g. usage-only frames) carry no choices
+            choices = chunk.get('choices')
+            if not choices:
+                continue
 
-🔧 NEXT STEPS
-1. Check CloudWatch Logs for detailed metrics
-2. Review DynamoDB entries for full analysis
-3. Retry AI analysis when service is available
+            delta = choices[0].get('delta') or {}
+            if delta.get('content'):
+                parts.append(delta['content'])
+        return ''.join(parts)
 
-For detailed insights, please check your DynamoDB table.
+    def _read_ndjson_stream(self, response: requests.Response) -> str:
         """
-
+        Accumulate an Ollama NDJSON stream into one string
+        """
+        parts = []
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = _json_loads(line)
+            if chunk.get('response'):
+                parts.append(chunk['response'])
+            if chunk.get('done'):
+                break
+        return ''.join(parts)
 
 # For local testing
 if __name__ == "__main__":
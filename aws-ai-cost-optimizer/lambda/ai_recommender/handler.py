@@ -3,14 +3,36 @@ AI Recommender Lambda Function
 Generates cost optimization reports using AI
 """
 
+import gzip
+import hashlib
 import json
+import time
 import boto3
 import os
+from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 from ai_client import AIClient
 from prompt_templates import get_cost_analysis_prompt
 
+# orjson speeds up the data-parsing and cache-key hot paths; stdlib json
+# stays for the small handler response bodies and as the fallback
+try:
+    import orjson
+
+    def _json_loads(data):
+        return orjson.loads(data)
+
+    def _stable_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS, default=str)
+except ImportError:
+    def _json_loads(data):
+        return json.loads(data)
+
+    def _stable_dumps(obj) -> bytes:
+        return json.dumps(obj, sort_keys=True, default=str).encode('utf-8')
+
 # Initialize AWS clients
 dynamodb = boto3.resource('dynamodb')
 sns = boto3.client('sns')
@@ -22,6 +44,22 @@ SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN', '')
 S3_BUCKET = os.environ.get('S3_BUCKET', '')
 ENABLE_EMAIL = os.environ.get('ENABLE_EMAIL_NOTIFICATIONS', 'true').lower() == 'true'
 ENABLE_S3 = os.environ.get('ENABLE_S3_REPORTS', 'true').lower() == 'true'
+REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL_SECONDS', '3600'))
+
+# In-memory report cache keyed by a hash of the analysis content.
+# Module-global so warm Lambda containers skip the LLM call entirely
+# when the underlying metrics haven't changed between runs
+_report_cache: Dict[str, Tuple[float, str]] = {}
+
+# Build the AI client once at import, like the boto3 clients above, so
+# warm invocations skip env parsing and model lookup. If construction
+# fails (e.g. misconfigured provider) we retry per-request and let the
+# fallback path handle it
+try:
+    _ai_client = AIClient()
+except Exception as e:
+    print(f"Error initializing AI client at import: {str(e)}")
+    _ai_client = None
 
 
 def lambda_handler(event, context):
@@ -44,17 +82,28 @@ def lambda_handler(event, context):
         
         # Step 2: Generate AI report
         ai_report = generate_ai_report(latest_analysis)
-        
-        # Step 3: Save report to S3 (optional)
-        if ENABLE_S3 and S3_BUCKET:
-            save_to_s3(ai_report)
-        
-        # Step 4: Send email notification (optional)
-        if ENABLE_EMAIL and SNS_TOPIC_ARN:
-            send_notification(ai_report)
-        
-        # Step 5: Update DynamoDB with report
-        update_analysis_with_report(latest_analysis['id'], ai_report)
+
+        # Steps 3-5 are independent network calls, so run them in
+        # parallel threads - boto3 releases the GIL during socket I/O,
+        # making the wall time the max of the three instead of the sum
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = []
+
+            # Step 3: Save report to S3 (optional)
+            if ENABLE_S3 and S3_BUCKET:
+                futures.append(executor.submit(save_to_s3, ai_report))
+
+            # Step 4: Send email notification (optional)
+            if ENABLE_EMAIL and SNS_TOPIC_ARN:
+                futures.append(executor.submit(send_notification, ai_report))
+
+            # Step 5: Update DynamoDB with report
+            futures.append(executor.submit(
+                update_analysis_with_report, latest_analysis['id'], ai_report
+            ))
+
+            for future in futures:
+                future.result()
         
         return {
             'statusCode': 200,
@@ -81,28 +130,32 @@ def get_latest_analysis() -> Dict[str, Any]:
     
     try:
         table = dynamodb.Table(TABLE_NAME)
-        
-        # Scan to get all items (in production, use better indexing)
-        response = table.scan(
-            Limit=10,
+
+        # Query the timestamp GSI descending - returns exactly the newest
+        # analysis without scanning the whole table
+        response = table.query(
+            IndexName='TimestampIndex',
+            KeyConditionExpression=Key('entity_type').eq('analysis'),
+            ScanIndexForward=False,
+            Limit=1,
             ProjectionExpression='id, #ts, #data, recommendations_count',
             ExpressionAttributeNames={
                 '#ts': 'timestamp',
                 '#data': 'data'
             }
         )
-        
+
         items = response.get('Items', [])
-        
+
         if not items:
             return None
-        
-        # Sort by timestamp and get latest
-        sorted_items = sorted(items, key=lambda x: x['timestamp'], reverse=True)
-        latest = sorted_items[0]
-        
-        # Parse the JSON data
-        latest['data'] = json.loads(latest['data'])
+
+        latest = items[0]
+
+        # Newer items store 'data' as a native Map; older ones stored a
+        # JSON string, so keep parsing those for backward compatibility
+        if isinstance(latest['data'], str):
+            latest['data'] = _json_loads(latest['data'])
         
         print(f"Found analysis from {latest['timestamp']}")
         return latest
@@ -112,25 +165,60 @@ def get_latest_analysis() -> Dict[str, Any]:
         return None
 
 
+def _report_cache_key(data: Dict[str, Any]) -> str:
+    """
+    Hash the report-relevant analysis content
+    default=str handles the Decimals that come back from DynamoDB
+    """
+    payload = _stable_dumps({
+        'r': data.get('recommendations'),
+        's': data.get('total_potential_savings')
+    })
+    return hashlib.md5(payload).hexdigest()
+
+
 def generate_ai_report(analysis_data: Dict[str, Any]) -> str:
     """
     Generate cost optimization report using AI
     """
     print("Generating AI report...")
-    
+
+    # Nothing to optimize - the AI could only say "no opportunities",
+    # so skip the provider call entirely
+    if not analysis_data.get('data', {}).get('recommendations'):
+        print("No recommendations found, skipping AI call")
+        return generate_fallback_report(analysis_data)
+
     try:
         # Extract the analysis data
         data = analysis_data['data']
-        
-        # Initialize AI client
-        ai_client = AIClient()
-        
-        # Generate report using AI
+
+        # Evict expired entries so the cache can't grow without bound
+        now = time.time()
+        for key in [k for k, (expires, _) in _report_cache.items() if expires <= now]:
+            del _report_cache[key]
+
+        # Reuse a cached report when the analysis content hasn't changed
+        cache_key = _report_cache_key(data)
+        cached = _report_cache.get(cache_key)
+
+        if cached:
+            print("Reusing cached AI report (analysis unchanged)")
+            return cached[1]
+
+        # Use the import-time client; rebuild only if that init failed
+        ai_client = _ai_client if _ai_client is not None else AIClient()
+
+        # Generate report using AI - raises AIProviderError on failure,
+        # so only successful generations ever reach the cache (a cached
+        # degraded report would poison every run until the TTL expired)
         report = ai_client.generate_report(data)
-        
+
+        _report_cache[cache_key] = (time.time() + REPORT_CACHE_TTL, report)
+
         print(f"AI report generated ({len(report)} characters)")
         return report
-        
+
     except Exception as e:
         print(f"Error generating AI report: {str(e)}")
         # Return fallback report
@@ -144,8 +232,22 @@ def generate_fallback_report(analysis_data: Dict[str, Any]) -> str:
     data = analysis_data['data']
     recommendations = data.get('recommendations', [])
     total_savings = data.get('total_potential_savings', 0)
-    
-    report = f"""
+
+    # Build the body with a join instead of repeated += (each str +=
+    # reallocates the whole string)
+    if recommendations:
+        body = "🎯 TOP RECOMMENDATIONS:\n\n" + "\n\n".join(
+            f"{idx}. {rec.get('type', 'Unknown').upper()}\n"
+            f"   Resource: {rec.get('resource_id', 'N/A')}\n"
+            f"   Savings: ${rec.get('estimated_savings', 0):.2f}/month\n"
+            f"   {rec.get('message', 'No details')}"
+            for idx, rec in enumerate(recommendations[:5], 1)
+        )
+    else:
+        body = ("✅ No optimization opportunities found at this time.\n"
+                "Your infrastructure appears well-optimized!")
+
+    return f"""
 ═══════════════════════════════════════════════════════════
  AWS COST OPTIMIZATION REPORT
  {datetime.now().strftime('%B %d, %Y')}
@@ -155,26 +257,12 @@ def generate_fallback_report(analysis_data: Dict[str, Any]) -> str:
 
 📊 RECOMMENDATIONS FOUND: {len(recommendations)}
 
-"""
-    
-    if recommendations:
-        report += "🎯 TOP RECOMMENDATIONS:\n\n"
-        for idx, rec in enumerate(recommendations[:5], 1):
-            report += f"{idx}. {rec.get('type', 'Unknown').upper()}\n"
-            report += f"   Resource: {rec.get('resource_id', 'N/A')}\n"
-            report += f"   Savings: ${rec.get('estimated_savings', 0):.2f}/month\n"
-            report += f"   {rec.get('message', 'No details')}\n\n"
-    else:
-        report += "✅ No optimization opportunities found at this time.\n"
-        report += "Your infrastructure appears well-optimized!\n\n"
-    
-    report += """
+{body}
+
 ═══════════════════════════════════════════════════════════
 Next analysis: Next scheduled run
 ═══════════════════════════════════════════════════════════
 """
-    
-    return report
 
 
 def save_to_s3(report: str) -> None:
@@ -189,15 +277,18 @@ def save_to_s3(report: str) -> None:
     
     try:
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        key = f"reports/cost-report_{timestamp}.txt"
-        
+        key = f"reports/cost-report_{timestamp}.txt.gz"
+
+        # Gzip before upload - text reports compress 5-10x, and clients
+        # that honor ContentEncoding still see plain text
         s3.put_object(
             Bucket=S3_BUCKET,
             Key=key,
-            Body=report.encode('utf-8'),
-            ContentType='text/plain'
+            Body=gzip.compress(report.encode('utf-8')),
+            ContentType='text/plain',
+            ContentEncoding='gzip'
         )
-        
+
         print(f"Report saved to s3://{S3_BUCKET}/{key}")
         
     except Exception as e:
@@ -244,7 +335,8 @@ def update_analysis_with_report(analysis_id: str, report: str) -> None:
             ExpressionAttributeValues={
                 ':report': report,
                 ':timestamp': datetime.now().isoformat()
-            }
+            },
+            ReturnValues='NONE'  # don't ship the updated item back
         )
         
         print("DynamoDB updated successfully")
@@ -79,21 +79,19 @@ def _format_recommendations(recommendations: list) -> str:
     """
     if not recommendations:
         return "No specific recommendations at this time."
-    
+
+    # Compact one-liners keep the prompt token count down
     formatted = []
     for idx, rec in enumerate(recommendations, 1):
         rec_type = rec.get('type', 'unknown')
         resource_id = rec.get('resource_id', 'N/A')
         message = rec.get('message', 'No details')
         savings = rec.get('estimated_savings', 0)
-        
-        formatted.append(f"""
-**Recommendation {idx}**: {rec_type}
-- Resource: {resource_id}
-- Issue: {message}
-- Potential Savings: ${savings:.2f}/month
-""")
-    
+
+        formatted.append(
+            f"{idx}. {rec_type} | {resource_id} | ${savings:.2f}/month | {message}"
+        )
+
     return "\n".join(formatted)
 
 
@@ -7,6 +7,7 @@ import json
 import boto3
 import os
 from datetime import datetime, timedelta
+from decimal import Decimal
 from typing import Dict, List, Any
 
 # Initialize AWS clients
@@ -79,42 +80,105 @@ def get_ec2_metrics() -> List[Dict[str, Any]]:
     print("Fetching EC2 instance metrics...")
     
     instances = []
-    
+
     try:
-        # Get all running EC2 instances
-        response = ec2.describe_instances(
-            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
+        # Get all running EC2 instances, paginating so accounts with more
+        # than one page of instances aren't silently truncated
+        paginator = ec2.get_paginator('describe_instances')
+        pages = paginator.paginate(
+            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}],
+            PaginationConfig={'PageSize': 1000}
         )
-        
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                instance_type = instance['InstanceType']
-                
-                # Get CPU utilization from CloudWatch (last 7 days average)
-                cpu_stats = get_cloudwatch_metric(
-                    namespace='AWS/EC2',
-                    metric_name='CPUUtilization',
-                    dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-                    days=7
-                )
-                
-                instances.append({
-                    'instance_id': instance_id,
-                    'instance_type': instance_type,
-                    'cpu_average': cpu_stats['average'],
-                    'cpu_max': cpu_stats['max'],
-                    'launch_time': instance['LaunchTime'].isoformat(),
-                })
-                
+
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    instances.append({
+                        'instance_id': instance['InstanceId'],
+                        'instance_type': instance['InstanceType'],
+                        'launch_time': instance['LaunchTime'].isoformat(),
+                    })
+
+        # Fetch CPU stats for all instances in one batched call instead
+        # of one CloudWatch round-trip per instance
+        cpu_stats = get_cpu_stats_batch([i['instance_id'] for i in instances])
+
+        for instance in instances:
+            stats = cpu_stats.get(instance['instance_id'], {'average': 0, 'max': None})
+            instance['cpu_average'] = stats['average']
+            instance['cpu_max'] = stats['max']
+
         print(f"Found {len(instances)} EC2 instances")
         return instances
-        
+
     except Exception as e:
         print(f"Error getting EC2 metrics: {str(e)}")
         return []
 
 
+def get_cpu_stats_batch(instance_ids: List[str], days: int = 7) -> Dict[str, Dict[str, Any]]:
+    """
+    Get CPU utilization stats for many instances with GetMetricData
+    One request carries up to 500 metric queries, so the whole fleet
+    costs a handful of round-trips instead of one per instance
+    Only Average is fetched - the analysis thresholds don't use Maximum,
+    and every extra statistic is another billed metric fetch. cpu 'max'
+    stays in the dict as None for schema compatibility
+    """
+    stats = {iid: {'average': 0, 'max': None} for iid in instance_ids}
+
+    if not instance_ids:
+        return stats
+
+    end_time = datetime.now()
+    start_time = end_time - timedelta(days=days)
+
+    queries = [
+        {
+            'Id': f'avg_{idx}',
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'AWS/EC2',
+                    'MetricName': 'CPUUtilization',
+                    'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}]
+                },
+                'Period': 86400,
+                'Stat': 'Average'
+            }
+        }
+        for idx, instance_id in enumerate(instance_ids)
+    ]
+
+    try:
+        paginator = cloudwatch.get_paginator('get_metric_data')
+
+        # GetMetricData caps each request at 500 queries
+        for start in range(0, len(queries), 500):
+            pages = paginator.paginate(
+                MetricDataQueries=queries[start:start + 500],
+                StartTime=start_time,
+                EndTime=end_time
+            )
+
+            for page in pages:
+                for result in page['MetricDataResults']:
+                    instance_id = instance_ids[int(result['Id'].split('_')[1])]
+                    values = result.get('Values', [])
+
+                    if values:
+                        stats[instance_id]['average'] = round(sum(values) / len(values), 2)
+
+    except Exception as e:
+        # A wholesale batch failure (e.g. AccessDenied) must not look
+        # like "every CPU is at 0%" - that would flag the whole fleet as
+        # underutilized with fabricated savings. Propagate instead;
+        # get_ec2_metrics reports no instances rather than bad data
+        print(f"Error getting CloudWatch metric data: {str(e)}")
+        raise
+
+    return stats
+
+
 def get_ebs_metrics() -> List[Dict[str, Any]]:
     """
     Get EBS volume metrics and identify unused volumes
@@ -124,25 +188,28 @@ def get_ebs_metrics() -> List[Dict[str, Any]]:
     volumes = []
     
     try:
-        # Get all EBS volumes
-        response = ec2.describe_volumes()
-        
-        for volume in response['Volumes']:
-            volume_id = volume['VolumeId']
-            size_gb = volume['Size']
-            state = volume['State']
-            
-            # Check if volume is attached
-            is_attached = len(volume.get('Attachments', [])) > 0
-            
-            volumes.append({
-                'volume_id': volume_id,
-                'size_gb': size_gb,
-                'state': state,
-                'is_attached': is_attached,
-                'created_time': volume['CreateTime'].isoformat()
-            })
-            
+        # Get all EBS volumes, paginating past the first page
+        paginator = ec2.get_paginator('describe_volumes')
+        pages = paginator.paginate(PaginationConfig={'PageSize': 500})
+
+        for page in pages:
+            for volume in page['Volumes']:
+                volume_id = volume['VolumeId']
+                size_gb = volume['Size']
+                state = volume['State']
+
+                # Check if volume is attached
+                is_attached = len(volume.get('Attachments', [])) > 0
+
+                volumes.append({
+                    'volume_id': volume_id,
+                    'size_gb': size_gb,
+                    'state': state,
+                    'is_attached': is_attached,
+                    'created_time': volume['CreateTime'].isoformat()
+                })
+
+
         print(f"Found {len(volumes)} EBS volumes")
         return volumes
         
@@ -151,14 +218,15 @@ def get_ebs_metrics() -> List[Dict[str, Any]]:
         return []
 
 
-def get_cloudwatch_metric(namespace: str, metric_name: str, 
-                          dimensions: List[Dict], days: int = 7) -> Dict[str, float]:
+def get_cloudwatch_metric(namespace: str, metric_name: str,
+                          dimensions: List[Dict], days: int = 7) -> Dict[str, Any]:
     """
-    Get CloudWatch metric statistics
+    Get CloudWatch metric statistics (Average only - the analysis
+    doesn't use Maximum, and each statistic is billed separately)
     """
     end_time = datetime.now()
     start_time = end_time - timedelta(days=days)
-    
+
     try:
         response = cloudwatch.get_metric_statistics(
             Namespace=namespace,
@@ -167,22 +235,21 @@ def get_cloudwatch_metric(namespace: str, metric_name: str,
             StartTime=start_time,
             EndTime=end_time,
             Period=86400,  # 1 day
-            Statistics=['Average', 'Maximum']
+            Statistics=['Average']
         )
-        
+
         datapoints = response['Datapoints']
-        
+
         if not datapoints:
-            return {'average': 0, 'max': 0}
-        
+            return {'average': 0, 'max': None}
+
         avg = sum(d['Average'] for d in datapoints) / len(datapoints)
-        max_val = max(d['Maximum'] for d in datapoints)
-        
-        return {'average': round(avg, 2), 'max': round(max_val, 2)}
-        
+
+        return {'average': round(avg, 2), 'max': None}
+
     except Exception as e:
         print(f"Error getting CloudWatch metric: {str(e)}")
-        return {'average': 0, 'max': 0}
+        return {'average': 0, 'max': None}
 
 
 def analyze_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
@@ -227,22 +294,39 @@ def analyze_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def _to_decimal(obj: Any) -> Any:
+    """
+    Recursively convert floats to Decimal (DynamoDB rejects float)
+    """
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    if isinstance(obj, dict):
+        return {k: _to_decimal(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_to_decimal(v) for v in obj]
+    return obj
+
+
 def store_results(results: Dict[str, Any]) -> None:
     """
     Store analysis results in DynamoDB
     """
     print(f"Storing results in DynamoDB table: {TABLE_NAME}")
-    
+
     try:
         table = dynamodb.Table(TABLE_NAME)
-        
+
+        # Store the results dict natively as a Map - no JSON string means
+        # no serialize/parse pass on either side and sub-attributes stay
+        # projectable
         table.put_item(
             Item={
                 'id': datetime.now().strftime('%Y-%m-%d_%H-%M-%S'),
+                'entity_type': 'analysis',  # constant partition key for TimestampIndex
                 'timestamp': results['timestamp'],
                 'recommendations_count': len(results['recommendations']),
                 'total_potential_savings': int(results['total_potential_savings']),
-                'data': json.dumps(results)
+                'data': _to_decimal(results)
             }
         )
         
@@ -15,15 +15,23 @@ resource "aws_dynamodb_table" "cost_data" {
     type = "S"
   }
 
+  attribute {
+    name = "entity_type"
+    type = "S"
+  }
+
   attribute {
     name = "timestamp"
     type = "S"
   }
 
-  # Global Secondary Index for querying by timestamp
+  # Global Secondary Index for fetching the latest analysis:
+  # constant partition key + timestamp sort key lets a single Query
+  # with ScanIndexForward=false return the newest item (no Scan)
   global_secondary_index {
     name            = "TimestampIndex"
-    hash_key        = "timestamp"
+    hash_key        = "entity_type"
+    range_key       = "timestamp"
     projection_type = "ALL"
     
     # Only needed if using PROVISIONED billing mode
@@ -42,6 +42,7 @@ resource "aws_iam_role_policy" "lambda_policy" {
         Effect = "Allow"
         Action = [
           "cloudwatch:GetMetricStatistics",
+          "cloudwatch:GetMetricData",
           "cloudwatch:ListMetrics"
         ]
         Resource = "*"
@@ -172,9 +173,14 @@ resource "aws_lambda_function" "ai_recommender" {
       AI_MODEL                   = var.ai_model
       AI_TEMPERATURE             = var.ai_temperature
       AI_MAX_TOKENS              = var.ai_max_tokens
+      AI_READ_TIMEOUT            = var.ai_read_timeout
+      REPORT_CACHE_TTL_SECONDS   = var.report_cache_ttl_seconds
       GROQ_API_KEY              = var.groq_api_key
+      GROQ_API_KEYS             = var.groq_api_keys
       OPENROUTER_API_KEY        = var.openrouter_api_key
+      OPENROUTER_API_KEYS       = var.openrouter_api_keys
       OLLAMA_HOST               = var.ollama_host
+      OLLAMA_HOSTS              = var.ollama_hosts
       ENABLE_EMAIL_NOTIFICATIONS = var.enable_email_notifications
       ENABLE_S3_REPORTS          = var.enable_s3_reports
     }
@@ -80,6 +80,18 @@ variable "ai_max_tokens" {
   default     = 2000
 }
 
+variable "ai_read_timeout" {
+  description = "Read timeout for AI provider calls (seconds)"
+  type        = number
+  default     = 20
+}
+
+variable "report_cache_ttl_seconds" {
+  description = "How long the AI recommender reuses a cached report for unchanged analysis data (seconds)"
+  type        = number
+  default     = 3600
+}
+
 # Groq Configuration
 variable "groq_api_key" {
   description = "Groq API key (optional - for Groq provider)"
@@ -88,6 +100,13 @@ variable "groq_api_key" {
   sensitive   = true
 }
 
+variable "groq_api_keys" {
+  description = "Comma-separated Groq API keys to rotate across (optional - overrides groq_api_key)"
+  type        = string
+  default     = ""
+  sensitive   = true
+}
+
 # OpenRouter Configuration
 variable "openrouter_api_key" {
   description = "OpenRouter API key (optional - for OpenRouter provider)"
@@ -96,6 +115,13 @@ variable "openrouter_api_key" {
   sensitive   = true
 }
 
+variable "openrouter_api_keys" {
+  description = "Comma-separated OpenRouter API keys to rotate across (optional - overrides openrouter_api_key)"
+  type        = string
+  default     = ""
+  sensitive   = true
+}
+
 # Ollama Configuration
 variable "ollama_host" {
   description = "Ollama host URL (optional - for Ollama provider)"
@@ -103,6 +129,12 @@ variable "ollama_host" {
   default     = "http://localhost:11434"
 }
 
+variable "ollama_hosts" {
+  description = "Comma-separated Ollama host URLs to rotate across (optional - overrides ollama_host)"
+  type        = string
+  default     = ""
+}
+
 # Schedule Configuration
 variable "schedule_expression" {
   description = "EventBridge schedule expression (cron or rate)"